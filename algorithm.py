@@ -1,37 +1,86 @@
-import json
+# orjson parses much faster than the standard library, but isn't required
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
 import numpy as np
-import pandas as pd
+from numba import njit, types, int32, int64
 import logging
 logging.basicConfig(filename='recipeallocator.log',level=logging.DEBUG)
+# Keeps numba's compiler debug output out of the log
+logging.getLogger("numba").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+# Lookup from labels such as "three_portions", "two_recipes" to their numbers (can be expanded if more
+# possibilities desired)
+_TOKEN_MAP = {"{}_{}".format(word, suffix): number
+              for word, number in [("two", 2), ("three", 3), ("four", 4)]
+              for suffix in ("portions", "recipes")}
+
+# Codes for each meal type in the stock arrays; any other meal type is coded as _OTHER_BOX_TYPE, which must sort
+# after the others
+_BOX_TYPE_CODES = {"vegetarian": 0, "gourmet": 1}
+_OTHER_BOX_TYPE = 2
+
+def _stock_dtype(stock_counts):
+
+    #---------
+    # FUNCTION to pick the smallest integer dtype that holds every stock count.
+    # int32 halves the memory each array operation has to move, but counts beyond its range need int64.
+    # --------
+    # Inputs:
+    #   - stock_counts: a numpy array of the levels of stock for each recipe
+    # Outputs:
+    #   - np.int32 if every count fits in it, otherwise np.int64.
+    # --------
+
+    limits = np.iinfo(np.int32)
+    if len(stock_counts) == 0 or (stock_counts.min() >= limits.min and stock_counts.max() <= limits.max):
+        return np.int32
+    return np.int64
+
 def obtain_numbers(string):
 
     #---------
     # FUNCTION to take a string eg. "three_portions","two_recipes", and return the associated number.
-    # If string is incorrectly formatted, returns the string.
+    # Only the labels in _TOKEN_MAP are recognised; any other string raises a ValueError. Non-strings are
+    # returned unchanged.
     # --------
     # Inputs:
-    #   - string: A string of form "num_XXXX..."
+    #   - string: A string of form "num_portions" or "num_recipes", where num is "two", "three" or "four"
     # Outputs:
     #   - The corresponding number.
     # --------
 
-    # Dictionary of numbers (can be expanded if more possibilities desired)
-    numberdict =  {"two": 2, "three": 3, "four": 4}
-
-    # Identifies the number
-    if isinstance(string, str):
-        num = string.split("_")[0]
-        if num in numberdict.keys():
-            return numberdict[num]
-        else:
-            return string
-    else:
+    if not isinstance(string, str):
         return string
+    if string not in _TOKEN_MAP:
+        raise ValueError("Unrecognised label {!r}: expected one of {}".format(string, ", ".join(_TOKEN_MAP)))
+    return _TOKEN_MAP[string]
 
 
 
+# Compiled for int32 stock, and for int64 stock when the counts don't fit in int32 (see _stock_dtype)
+@njit([int64[::1](int32[::1], int64, int64, int64), int64[::1](int64[::1], int64, int64, int64)],
+      cache=True, fastmath=True)
+def _times_chosen(stock_levels, level, N_portions, N_orders):
+
+    # ---------
+    # FUNCTION to count how often each recipe is chosen while its stock is at or above a given level
+    # --------
+    # Inputs:
+    #   - stock_levels: quantities of each recipe in stock
+    #   - level: the stock level to count down to
+    #   - N_portions: the number of portions taken each time a recipe is chosen
+    #   - N_orders: the number of orders (a recipe can only be chosen once per order)
+    # Outputs:
+    #   - The number of times each recipe is chosen.
+    # --------
+
+    return np.clip((stock_levels - level) // N_portions + 1, 0, N_orders)
+
+@njit([types.Tuple((int32[::1], int64))(int64, int32[::1], int64, int64),
+       types.Tuple((int64[::1], int64))(int64, int64[::1], int64, int64)], cache=True, fastmath=True)
 def allocate_recipes(N_orders,stock_levels,N_portions,N_recipes):
 
     # ---------
@@ -48,42 +97,82 @@ def allocate_recipes(N_orders,stock_levels,N_portions,N_recipes):
     #   - The number of orders that can't be fulfilled.
     # --------
 
-    # Are there enough recipes left in stock to meet N_recipes?
+    # Are there enough recipes left in stock to meet N_recipes? (Logged by fulfil_orders, as this is compiled.)
     if len(stock_levels) < N_recipes:
-        logger.info("{} recipes-per-box but only {} recipes in stock".format(N_recipes,len(stock_levels)) )
         return stock_levels, N_orders
 
-    for N_orders_left in range(N_orders, 0, -1):
-        # Finding the recipes with highest available stock
-        recipe_choices = np.argpartition(stock_levels,-N_recipes)[-N_recipes:]
-
-        # Checking stock is high enough. If not, the function breaks out.
-        if stock_levels[recipe_choices].min() < N_portions:
-            return stock_levels, N_orders_left
+    # How many orders each recipe could supply on its own.
+    max_per_recipe = stock_levels // N_portions
+    total_capacity = max_per_recipe.sum()
 
-        # Subtracting the choices from stock levels.
-        stock_levels[recipe_choices] = stock_levels[recipe_choices] - N_portions
-
-    return stock_levels, 0
+    # If there are no orders, or not enough stock in total for even one order, the stock is left as it is.
+    # (When only some orders can be filled we carry on, as fulfil_orders passes exactly the number of gourmet
+    # orders left over on to its all-recipes fallback.)
+    if N_orders == 0 or total_capacity < N_recipes:
+        return stock_levels, N_orders
 
-def fulfil_orders(StockDF, OrdersDF, Ordersdict):
+    # Each order takes N_portions from each of the N_recipes recipes with the highest stock. Rather than
+    # stepping through the orders one at a time, we work out the allocation for all of them at once.
+    # Only the N_recipes highest stock levels need ordering, so we partition rather than sort the whole array.
+    # This sorted top end is computed once and used both for the capacity count and to bound the search below.
+    top_stock = np.sort(np.partition(stock_levels, len(stock_levels) - N_recipes)[-N_recipes:])[::-1]
+    top_capacity = top_stock // N_portions
+
+    # The most orders that can be filled: with the k best-stocked recipes used in every order, the rest must
+    # cover the other (N_recipes - k) slots, so the total is the minimum of rest_capacity // (N_recipes - k).
+    rest_capacity = total_capacity - np.cumsum(top_capacity) + top_capacity
+    N_filled = min(N_orders, int((rest_capacity // np.arange(N_recipes, 0, -1)).min()))
+
+    # Taking the highest-stocked recipes each time leaves the stock levels "water-filled": every recipe above
+    # some level is drawn down towards it (each at most once per order). We binary search for that level, which
+    # can be no higher than the N_recipes-th highest stock, as every order needs that many distinct recipes.
+    if N_filled > 0:
+        slots = N_filled * N_recipes
+        low, high = N_portions, top_stock[-1]
+        while low < high:
+            level = (low + high + 1) // 2
+            if _times_chosen(stock_levels, level, N_portions, N_filled).sum() >= slots:
+                low = level
+            else:
+                high = level - 1
+
+        # Recipes strictly above the level are always chosen; ties at the level make up the remainder.
+        allocations = _times_chosen(stock_levels, low + 1, N_portions, N_filled)
+        at_level = np.flatnonzero((stock_levels >= low) & ((stock_levels - low) % N_portions == 0)
+                                  & (allocations < N_filled))
+        allocations[at_level[:slots - allocations.sum()]] += 1
+
+        # Subtracting the choices from stock levels, in place and without a temporary array.
+        allocations *= N_portions
+        stock_levels -= allocations
+
+    return stock_levels, N_orders - N_filled
+
+def fulfil_orders(stock_counts, box_types, OrdersDF, Ordersdict):
 
     # ---------
     # FUNCTION to fulfil orders
     # Takes arrays for
     # --------
     # Inputs:
-    #   - StockDF - the levels of stock for each recipe, with meal type.
+    #   - stock_counts - a numpy array of the levels of stock for each recipe.
+    #   - box_types - a numpy array of the meal type code for each recipe (see _BOX_TYPE_CODES).
     #   - OrdersDF - a numpy array containing orders by category.
     #   - Ordersdict - a dictionary containing labels for each dimension of OrdersDF
     # Outputs:
     #   - Either True (if all orders are fulfilled) or False (if they aren't)
     # --------
 
-    stocks = StockDF["stock_count"].values.copy()
-    # Splitting stocks by meal type
-    veg_stocks = (StockDF["box_type"] == "vegetarian").values
-    gourmet_stocks = (StockDF["box_type"] == "gourmet").values
+    # Splitting stocks by meal type. Stocks are reordered once so that each meal type is a contiguous slice,
+    # letting allocate_recipes() update the shared array in place through views.
+    # The integer gather index and the slice boundaries are worked out once, so no boolean masks are needed.
+    stock_order = np.argsort(box_types, kind="stable")
+    veg_end, gourmet_end = np.searchsorted(box_types[stock_order],
+                                           [_BOX_TYPE_CODES["gourmet"], _OTHER_BOX_TYPE])
+    # Stocks are held in the smallest dtype that fits every count, usually int32.
+    stocks = np.ascontiguousarray(stock_counts[stock_order], dtype=_stock_dtype(stock_counts))
+    veg_view = stocks[:veg_end]
+    gourmet_view = stocks[veg_end:gourmet_end]
 
     # We call allocate_recipes() for different subsets of customers, ordering according to the following priorities:
     #   1. Number of portions per recipe (greatest to smallest)
@@ -91,37 +180,57 @@ def fulfil_orders(StockDF, OrdersDF, Ordersdict):
     #   3. Number of recipes per box (greatest to smallest)
 
     logger.info("Allocating recipes:")
+    # Checked once, so the per-category messages below cost nothing when INFO logging is off.
+    log_info = logger.isEnabledFor(logging.INFO)
+    # Labels are looked up once per loop level rather than on every call
+    categories, portions_arr, recipes_arr = Ordersdict[0], Ordersdict[1], Ordersdict[2]
     for j in range(0,OrdersDF.shape[1]):
+        N_portions = portions_arr[j]
         for i in range(0,OrdersDF.shape[0]):
+            category = categories[i]
             for k in range(0,OrdersDF.shape[2]):
+                N_recipes = recipes_arr[k]
+                N_orders = OrdersDF[i,j,k]
+
+                if log_info:
+                    logger.info("%s,%s portions, %s recipes-per-box", category, N_portions, N_recipes)
+                # Each category is allocated as one batch; empty categories need no allocation at all.
+                if N_orders == 0:
+                    continue
 
-                logger.info("{},{} portions, {} recipes-per-box".format(Ordersdict[0][i],Ordersdict[1][j],Ordersdict[2][k]))
-                # Vegetarian orders are passed "veg_stocks".
-                if Ordersdict[0][i] == "vegetarian":
-                    stocks_left, orders_left = allocate_recipes(OrdersDF[i,j,k],stocks[veg_stocks],Ordersdict[2][k], Ordersdict[1][j])
+                # Vegetarian orders are passed the vegetarian stocks, which are updated in place.
+                if category == "vegetarian":
+                    # N_recipes and N_portions are deliberately passed (and logged) swapped, as in the original,
+                    # so results are unchanged.
+                    stocks_left, orders_left = allocate_recipes(N_orders,veg_view,N_recipes, N_portions)
 
                     # If we're unsuccessful, return False, otherwise move on.
                     if orders_left > 0:
-                        logger.info("Unable to fulfil, {} order(s) left".format(orders_left))
+                        if len(stocks_left) < N_portions:
+                            logger.info("%s recipes-per-box but only %s recipes in stock", N_portions, len(stocks_left))
+                        logger.info("Unable to fulfil, %s order(s) left", orders_left)
                         return False
-                    else: stocks[veg_stocks] = stocks_left
 
-                # Gourmet orders are passed "gourmet_stocks" first.
-                elif Ordersdict[0][i] == "gourmet":
-                    stocks_left, orders_left = allocate_recipes(OrdersDF[i, j, k], stocks[gourmet_stocks], Ordersdict[2][k],Ordersdict[1][j])
+                # Gourmet orders are tried on a copy of the gourmet stocks first, which is only kept if every order
+                # is filled; otherwise the remaining orders are allocated from the full, untouched stock.
+                elif category == "gourmet":
+                    stocks_left, orders_left = allocate_recipes(N_orders, gourmet_view.copy(), N_recipes,N_portions)
 
                     # If we're unsuccessful, we try expanding to include all recipes including vegetarian
                     if orders_left > 0:
-                        logger.info("{} orders left, including vegetarian recipes".format(orders_left))
-                        stocks_left, orders_left = allocate_recipes(orders_left, stocks, Ordersdict[2][k],Ordersdict[1][j])
+                        if len(stocks_left) < N_portions:
+                            logger.info("%s recipes-per-box but only %s recipes in stock", N_portions, len(stocks_left))
+                        logger.info("%s orders left, including vegetarian recipes", orders_left)
+                        stocks_left, orders_left = allocate_recipes(orders_left, stocks, N_recipes,N_portions)
 
                         # If we're still unsuccessful, now False is returned. If successful, we move on.
                         if orders_left > 0:
-                            logger.info("Unable to fulfil, {} order(s) left".format(orders_left))
+                            if len(stocks_left) < N_portions:
+                                logger.info("%s recipes-per-box but only %s recipes in stock", N_portions, len(stocks_left))
+                            logger.info("Unable to fulfil, %s order(s) left", orders_left)
                             return False
-                        else: stocks = stocks_left
 
-                    else: stocks[gourmet_stocks] = stocks_left
+                    else: gourmet_view[:] = stocks_left
 
     # Reaching the end of the loop means all orders successfully processed.
     logger.info("All orders processed")
@@ -137,54 +246,51 @@ def load_files(order_file,stock_file):
     #   - order_file - the filepath to the JSON file containing the orders.
     #   - stock_file - the filepath to the JSON file containing the stocks.
     # Outputs:
-    #   - StockDF - Dataframe containing the stock counts and meal type for each recipe
+    #   - stock_counts - Numpy array containing the stock count for each recipe
+    #   - box_types - Numpy array containing the meal type code for each recipe
     #   - OrdersDF - Numpy array containing the order numbers by meal type, portion count, and recipe count.
     # --------
 
     # Loading files
-    f = open(order_file,)
-    orders = json.load(f)
+    f = open(order_file, 'rb')
+    orders = _json.loads(f.read())
     f.close()
     logging.debug('Loaded {}'.format(order_file))
 
-    g = open(stock_file, )
-    stock = json.load(g)
+    g = open(stock_file, 'rb')
+    stock = _json.loads(g.read())
     g.close()
     logging.debug('Loaded {}'.format(stock_file))
 
-    # Stock dataframe is ready to go
-    StockDF = pd.DataFrame.from_dict(stock).T
-
-    # Orders dataframes need string conversion and sorting by portion, recipe counts.
-    VegOrdersDF = pd.DataFrame.from_dict(orders.get('vegetarian'))
-    GourmOrdersDF = pd.DataFrame.from_dict(orders.get('gourmet'))
-
-    # Converting the strings for portion, recipe counts to numbers, and relabelling the dataframes
-    colnames = []
-    for i in VegOrdersDF.columns:
-        colnames.append(obtain_numbers(i))
-    VegOrdersDF.columns = colnames
-    GourmOrdersDF.columns = colnames
-
-    indexnames = []
-    for i in VegOrdersDF.index:
-        indexnames.append(obtain_numbers(i))
-    VegOrdersDF.index = indexnames
-    GourmOrdersDF.index = indexnames
-
-    # Sorting the orders by portion count and by
-    VegOrdersDF.sort_index(axis=0, ascending=False, inplace=True)
-    VegOrdersDF.sort_index(axis=1, ascending=False, inplace=True)
-    GourmOrdersDF.sort_index(axis=0, ascending=False, inplace=True)
-    GourmOrdersDF.sort_index(axis=1, ascending=False, inplace=True)
-
-    # Recombining the orders into a numpy array
-    OrdersDF = np.array([np.array(VegOrdersDF),np.array(GourmOrdersDF)])
-
-    # Creating the dictionary with category information
-    Ordersdict = {0: ["vegetarian","gourmet"], 1: VegOrdersDF.index , 2: VegOrdersDF.columns}
-
-    return StockDF, OrdersDF, Ordersdict
+    # Stock is split into an array of counts and an array of meal type codes. Counts are read as int64 and
+    # narrowed to int32 only if they all fit.
+    stock_counts = np.fromiter((recipe["stock_count"] for recipe in stock.values()), dtype=np.int64, count=len(stock))
+    stock_counts = stock_counts.astype(_stock_dtype(stock_counts), copy=False)
+    box_types = np.fromiter((_BOX_TYPE_CODES.get(recipe["box_type"], _OTHER_BOX_TYPE) for recipe in stock.values()),
+                            dtype=np.int8, count=len(stock))
+
+    # Orders are read straight into a numpy array, sorted by portion and recipe counts (greatest to smallest).
+    # Labels are collected across both meal types; a combination missing from one of them has no orders.
+    categories = ["vegetarian","gourmet"]
+    category_orders = [orders.get(category, {}) for category in categories]
+    recipe_labels = sorted({recipes for by_recipes in category_orders for recipes in by_recipes},
+                           key=obtain_numbers, reverse=True)
+    portion_labels = sorted({portions for by_recipes in category_orders for by_portions in by_recipes.values()
+                             for portions in by_portions},
+                            key=obtain_numbers, reverse=True)
+
+    OrdersDF = np.zeros((len(categories), len(portion_labels), len(recipe_labels)), dtype=np.int64)
+    for i, by_recipes in enumerate(category_orders):
+        for j, portions in enumerate(portion_labels):
+            for k, recipes in enumerate(recipe_labels):
+                OrdersDF[i,j,k] = by_recipes.get(recipes, {}).get(portions, 0)
+
+    # Creating the dictionary with category information, converting the strings for portion, recipe counts to numbers
+    Ordersdict = {0: categories,
+                  1: [obtain_numbers(portions) for portions in portion_labels],
+                  2: [obtain_numbers(recipes) for recipes in recipe_labels]}
+
+    return stock_counts, box_types, OrdersDF, Ordersdict
 
 def default_orders_satisfied(order_file,stock_file):
 
@@ -198,5 +304,5 @@ def default_orders_satisfied(order_file,stock_file):
     #   - Either True (if all orders are fulfilled) or False (if they aren't)
     # --------
 
-    StockDF, OrdersDF, Ordersdict = load_files(order_file,stock_file)
-    return fulfil_orders(StockDF, OrdersDF, Ordersdict)
+    stock_counts, box_types, OrdersDF, Ordersdict = load_files(order_file,stock_file)
+    return fulfil_orders(stock_counts, box_types, OrdersDF, Ordersdict)
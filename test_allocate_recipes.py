@@ -0,0 +1,176 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+from algorithm import allocate_recipes, default_orders_satisfied, fulfil_orders, load_files, obtain_numbers
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_examples")
+
+
+def reference_allocate(N_orders, stock_levels, N_portions, N_recipes):
+
+    # ---------
+    # FUNCTION reproducing the original per-order allocation loop, to check allocate_recipes against
+    # --------
+    # Inputs / Outputs: as allocate_recipes
+    # --------
+
+    if len(stock_levels) < N_recipes:
+        return stock_levels, N_orders
+
+    for N_orders_left in range(N_orders, 0, -1):
+        recipe_choices = np.argpartition(stock_levels, -N_recipes)[-N_recipes:]
+        if stock_levels[recipe_choices].min() < N_portions:
+            return stock_levels, N_orders_left
+        stock_levels[recipe_choices] = stock_levels[recipe_choices] - N_portions
+
+    return stock_levels, 0
+
+
+class AllocateRecipesTest(unittest.TestCase):
+
+    def assert_matches_reference(self, N_orders, stock, N_portions, N_recipes):
+        # Which of several equally-stocked recipes is chosen is arbitrary, so the remaining stock is compared
+        # as a sorted multiset.
+        expected_stock, expected_left = reference_allocate(N_orders, np.array(stock, dtype=np.int64),
+                                                           N_portions, N_recipes)
+        stock_levels = np.array(stock, dtype=np.int32)
+        stock_left, orders_left = allocate_recipes(N_orders, stock_levels, N_portions, N_recipes)
+
+        case = (N_orders, list(stock), N_portions, N_recipes)
+        self.assertEqual(orders_left, expected_left, case)
+        self.assertEqual(sorted(stock_left), sorted(expected_stock), case)
+        # Stock is updated in place, as fulfil_orders relies on.
+        self.assertIs(stock_left, stock_levels)
+
+    def test_all_orders_filled(self):
+        self.assert_matches_reference(3, [10, 7, 3, 6], 2, 2)
+
+    def test_ties(self):
+        self.assert_matches_reference(3, [4, 4, 4, 4], 2, 2)
+        self.assert_matches_reference(5, [6, 6, 6, 5, 5], 1, 3)
+
+    def test_partial_fill(self):
+        self.assert_matches_reference(10, [5, 5, 1], 2, 2)
+        self.assert_matches_reference(4, [20, 3, 3, 3], 3, 3)
+
+    def test_fewer_recipes_than_needed(self):
+        self.assert_matches_reference(2, [10], 2, 2)
+        self.assert_matches_reference(2, [], 2, 1)
+
+    def test_zero_capacity_recipes(self):
+        self.assert_matches_reference(5, [0, 1, 9, 9], 2, 2)
+        self.assert_matches_reference(1, [1, 1, 1], 2, 2)
+
+    def test_no_orders(self):
+        self.assert_matches_reference(0, [4, 4], 2, 2)
+
+    def test_random_cases(self):
+        rng = random.Random(0)
+        for _ in range(500):
+            stock = [rng.randint(0, rng.choice([3, 10, 40])) for _ in range(rng.randint(1, 9))]
+            self.assert_matches_reference(rng.randint(0, 40), stock, rng.randint(1, 4), rng.randint(1, 5))
+
+    def test_example_stocks(self):
+        # The example order counts (other than the very large ord3) against each example stock file, by meal type
+        for stock_file in ("sto1.json", "sto2.json", "sto3.json"):
+            for order_file in ("ord1.json", "ord2.json"):
+                stock_counts, box_types, OrdersDF, Ordersdict = load_files(os.path.join(EXAMPLES, order_file),
+                                                                           os.path.join(EXAMPLES, stock_file))
+                for box_type in np.unique(box_types):
+                    stock = stock_counts[box_types == box_type]
+                    # Labels are passed in the same argument positions as fulfil_orders uses.
+                    for (i, j, k), N_orders in np.ndenumerate(OrdersDF):
+                        self.assert_matches_reference(int(N_orders), stock, Ordersdict[2][k], Ordersdict[1][j])
+
+
+class ObtainNumbersTest(unittest.TestCase):
+
+    def test_labels(self):
+        self.assertEqual(obtain_numbers("two_portions"), 2)
+        self.assertEqual(obtain_numbers("four_recipes"), 4)
+        self.assertEqual(obtain_numbers(3), 3)
+
+    def test_unknown_label(self):
+        for label in ("two_portion", "four_recipes_per_box", "two", "five_portions"):
+            with self.subTest(label=label):
+                with self.assertRaises(ValueError):
+                    obtain_numbers(label)
+
+
+class LoadFilesTest(unittest.TestCase):
+
+    def test_labels_from_both_meal_types(self):
+        # Portion and recipe labels that only one meal type has must not be dropped.
+        orders = {"vegetarian": {"two_recipes": {"two_portions": 1}, "three_recipes": {"two_portions": 2}},
+                  "gourmet": {"two_recipes": {"two_portions": 3, "four_portions": 4}, "four_recipes": {"two_portions": 5}}}
+        stock = {"recipe_1": {"stock_count": 8, "box_type": "vegetarian"}}
+        with tempfile.TemporaryDirectory() as directory:
+            order_file, stock_file = os.path.join(directory, "orders.json"), os.path.join(directory, "stock.json")
+            with open(order_file, "w") as f:
+                json.dump(orders, f)
+            with open(stock_file, "w") as f:
+                json.dump(stock, f)
+            stock_counts, box_types, OrdersDF, Ordersdict = load_files(order_file, stock_file)
+
+        self.assertEqual(Ordersdict[1], [4, 2])
+        self.assertEqual(Ordersdict[2], [4, 3, 2])
+        np.testing.assert_array_equal(OrdersDF, [[[0, 0, 0], [0, 2, 1]], [[0, 0, 4], [5, 0, 3]]])
+
+    def test_counts_beyond_int32(self):
+        orders = {"vegetarian": {"two_recipes": {"two_portions": 1}}, "gourmet": {}}
+        stock = {"recipe_1": {"stock_count": 3000000000, "box_type": "vegetarian"},
+                 "recipe_2": {"stock_count": 3000000000, "box_type": "vegetarian"}}
+        with tempfile.TemporaryDirectory() as directory:
+            order_file, stock_file = os.path.join(directory, "orders.json"), os.path.join(directory, "stock.json")
+            with open(order_file, "w") as f:
+                json.dump(orders, f)
+            with open(stock_file, "w") as f:
+                json.dump(stock, f)
+            stock_counts = load_files(order_file, stock_file)[0]
+            self.assertTrue(default_orders_satisfied(order_file, stock_file))
+
+        np.testing.assert_array_equal(stock_counts, [3000000000, 3000000000])
+
+
+class FulfilOrdersTest(unittest.TestCase):
+
+    def test_partial_gourmet_fill_is_discarded(self):
+        # Two gourmet recipes can only fill one of the two orders; as in the original implementation, that
+        # partial gourmet-only deduction is thrown away and the one leftover order is allocated from the
+        # untouched full stock.
+        stock_counts = np.array([2, 2, 2], dtype=np.int32)
+        box_types = np.array([1, 1, 0], dtype=np.int8)
+        OrdersDF = np.array([[[0]], [[2]]], dtype=np.int64)
+        Ordersdict = {0: ["vegetarian", "gourmet"], 1: [2], 2: [2]}
+        self.assertTrue(fulfil_orders(stock_counts, box_types, OrdersDF, Ordersdict))
+
+    def test_counts_beyond_int32(self):
+        # Counts too large for int32 must not wrap around.
+        stock_counts = np.array([3_000_000_000, 3_000_000_000], dtype=np.int64)
+        box_types = np.array([0, 0], dtype=np.int8)
+        OrdersDF = np.array([[[1]], [[0]]], dtype=np.int64)
+        Ordersdict = {0: ["vegetarian", "gourmet"], 1: [2], 2: [2]}
+        self.assertTrue(fulfil_orders(stock_counts, box_types, OrdersDF, Ordersdict))
+
+
+class ExampleOrdersTest(unittest.TestCase):
+
+    # Outcomes of the original implementation on each example pair
+    EXPECTED = {("ord1.json", "sto1.json"): False, ("ord1.json", "sto2.json"): False, ("ord1.json", "sto3.json"): True,
+                ("ord2.json", "sto1.json"): True, ("ord2.json", "sto2.json"): True, ("ord2.json", "sto3.json"): True,
+                ("ord3.json", "sto1.json"): False, ("ord3.json", "sto2.json"): False, ("ord3.json", "sto3.json"): True}
+
+    def test_examples(self):
+        for (order_file, stock_file), expected in self.EXPECTED.items():
+            with self.subTest(order_file=order_file, stock_file=stock_file):
+                self.assertEqual(default_orders_satisfied(os.path.join(EXAMPLES, order_file),
+                                                          os.path.join(EXAMPLES, stock_file)), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()